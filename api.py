@@ -36,8 +36,9 @@ import sys
 project_root = os.path.abspath(os.path.dirname(__file__))
 sys.path.insert(0, project_root)
 
-# Import your existing crew creation function
-from src.rag_system.crew import create_rag_crew
+# Import the crew runner (crews are built once per worker thread and reused)
+from src.rag_system.crew import run_rag_query
+from src.rag_system.http_client import OLLAMA_NUM_CTX
 
 # Load environment variables
 load_dotenv()
@@ -80,8 +81,8 @@ def list_models():
                 "permission": [],
                 "root": "crew-ai-rag",
                 "parent": None,
-                "max_tokens": 131072,        # Updated to match gemma3:4b max tokens
-                "context_length": 131072     # Updated to match gemma3:4b context length
+                "max_tokens": 2048,          # Updated to match the crew LLM max_tokens
+                "context_length": OLLAMA_NUM_CTX  # Matches the crew LLM num_ctx
             }
         ]
     }
@@ -100,8 +101,7 @@ def chat_completions(request: ChatCompletionRequest):
     print(f"Received query for API: {user_message}")
 
     # Kick off the CrewAI crew with the user's query
-    rag_crew = create_rag_crew(user_message)
-    result = rag_crew.kickoff()
+    result = run_rag_query(user_message)
     
     # Format the response to be compatible with the OpenAI API standard
     response = {
@@ -25,7 +25,7 @@ except Exception as e:
 
 
 import sys
-from src.rag_system.crew import create_rag_crew
+from src.rag_system.crew import run_rag_query
 
 def main():
     """
@@ -46,9 +46,8 @@ def main():
     print(f"\n🚀 Kicking off the RAG Crew for your query: '{query}'")
     print("--------------------------------------------------")
 
-    # Create and run the RAG crew
-    rag_crew = create_rag_crew(query)
-    result = rag_crew.kickoff()
+    # Run the RAG crew
+    result = run_rag_query(query)
 
     print("\n--------------------------------------------------")
     print("✅ Crew execution finished. Here is the final answer:")
@@ -29,6 +29,12 @@ import nest_asyncio
 from openinference.instrumentation.llama_index import LlamaIndexInstrumentor
 from phoenix.otel import register
 
+# Add the project root to the Python path to allow importing from 'src'
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, project_root)
+
+from src.rag_system.http_client import OLLAMA_EMBED_MODEL, OLLAMA_LLM_MODEL, OLLAMA_KEEP_ALIVE, OLLAMA_NUM_CTX
+
 
 # Configure logging
 logging.basicConfig(
@@ -59,7 +65,14 @@ TABLE_NAME = "nbs_doc_md_contextual_rag"
 EMBED_DIM = 768
 
 # Contextual RAG Configuration
-CONTEXT_LLM_MODEL = "gemma3:4b"
+# Same chat model tag as the crew agents (see http_client), so ingestion and serving share one resident model
+CONTEXT_LLM_MODEL = OLLAMA_LLM_MODEL
+# Embedding model - same as retrieval (see http_client); a q8_0 quant of nomic-embed-text keeps the same
+# 768-dim vector space at higher throughput
+EMBED_MODEL = OLLAMA_EMBED_MODEL
+# Opt-in FP16 (HALFVEC) embedding column - must match the retrieval tool; migrate existing
+# VECTOR tables first with test/test_PGVector_similarity_search.py --migrate-halfvec
+PGVECTOR_USE_HALFVEC = os.getenv("PGVECTOR_USE_HALFVEC", "0") == "1"
 OLLAMA_BASE_URL = "http://localhost:11434"
 
 # Prompts for contextual retrieval
@@ -124,7 +137,7 @@ def test_ollama_connection():
         models = response.json().get('models', [])
         model_names = [model['name'] for model in models]
         
-        required_models = [CONTEXT_LLM_MODEL, "nomic-embed-text:v1.5"]
+        required_models = [CONTEXT_LLM_MODEL, EMBED_MODEL]
         missing_models = [model for model in required_models if model not in model_names]
         
         if missing_models:
@@ -184,6 +197,8 @@ def create_contextual_nodes(nodes: List[TextNode], whole_document: str) -> List[
     context_llm = Ollama(
         model=CONTEXT_LLM_MODEL,
         base_url=OLLAMA_BASE_URL,
+        keep_alive=OLLAMA_KEEP_ALIVE,
+        context_window=OLLAMA_NUM_CTX,  # Same num_ctx as the crew LLM, otherwise Ollama reloads the model
         request_timeout=120.0
     )
     
@@ -296,7 +311,7 @@ def main():
         # Step 5: Configure embedding model
         logger.info("Configuring embedding model...")
         Settings.embed_model = OllamaEmbedding(
-            model_name="nomic-embed-text:v1.5",
+            model_name=EMBED_MODEL,
             base_url=OLLAMA_BASE_URL,
         )
         
@@ -310,13 +325,14 @@ def main():
             password=DB_PASSWORD,
             table_name=TABLE_NAME,
             embed_dim=EMBED_DIM,
+            use_halfvec=PGVECTOR_USE_HALFVEC,  # FP16 column halves the bytes per distance evaluation
             hybrid_search=True,
             text_search_config="english",
             hnsw_kwargs={
                 "hnsw_m": 16,
                 "hnsw_ef_construction": 64,
                 "hnsw_ef_search": 40,
-                "hnsw_dist_method": "vector_cosine_ops"
+                "hnsw_dist_method": "halfvec_cosine_ops" if PGVECTOR_USE_HALFVEC else "vector_cosine_ops"
             }
         )
         logger.info("✅ Vector store created")
@@ -0,0 +1,128 @@
+import os
+import re
+import json
+import math
+import hashlib
+import threading
+from typing import Any, Callable, Dict, List, Optional, Set
+
+
+# Cosine similarity thresholds between the incoming query and a cached query
+EXACT_HIT_SIMILARITY = 0.97         # Same question - return the cached answer without running anything
+PARAPHRASE_HIT_SIMILARITY = 0.85    # Likely paraphrase - re-run retrieval and compare the evidence first
+
+# Minimum Jaccard overlap between cached and freshly retrieved chunks for a paraphrase hit
+MIN_EVIDENCE_JACCARD = 0.8
+
+# Header written by the Document Retrieval Tool in front of every chunk
+_CHUNK_HEADER_RE = re.compile(r"\*\*Document Chunk \d+\*\*")
+
+
+def normalize_query(query: str) -> str:
+    """Lower-case the query and collapse whitespace/punctuation so trivial variations share a key."""
+    return " ".join(re.sub(r"[^\w\s]", " ", query.lower()).split())
+
+
+def evidence_signature(retrieved_context: str) -> Set[str]:
+    """Turn the Document Retrieval Tool output into a set of chunk IDs (hash of each chunk's text)."""
+    # Only the text after each chunk header counts - whatever precedes the first header (the tool's
+    # "=====" separator) is not a chunk
+    chunks = [chunk.strip() for chunk in _CHUNK_HEADER_RE.split(retrieved_context or "")[1:]]
+    return {hashlib.sha1(chunk.encode("utf-8")).hexdigest() for chunk in chunks if chunk}
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = math.fsum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(math.fsum(x * x for x in a)) * math.sqrt(math.fsum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a and not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class GroundedAnswerCache:
+    """
+    Semantic answer cache placed in front of the RAG pipeline.
+    - Exact-repeat queries (cosine >= EXACT_HIT_SIMILARITY) skip the whole crew.
+    - Paraphrases (cosine >= PARAPHRASE_HIT_SIMILARITY) re-run retrieval only and reuse the cached
+      answer if the retrieved evidence still matches, so stale answers are rejected.
+    The cache is persisted as JSON so it survives across evaluation runs. Entries are scoped by
+    namespace (a fingerprint of the model/prompt configuration), so answers produced under a
+    different configuration are never returned.
+    """
+
+    def __init__(self, path: str, embed_model: Any, retrieve: Callable[[str], str], namespace: str = ""):
+        self.path = path
+        self.embed_model = embed_model  # Any LlamaIndex embedding model (get_query_embedding)
+        self.retrieve = retrieve        # Returns the formatted retrieval context for a query
+        self.namespace = namespace
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except Exception as e:
+            print(f"Warning: Could not load answer cache from {self.path}: {e}")
+            self._entries = {}
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.path)
+
+    def _key(self, query: str) -> str:
+        return hashlib.sha1(f"{self.namespace}\n{normalize_query(query)}".encode("utf-8")).hexdigest()
+
+    def lookup(self, query: str) -> Optional[Dict[str, Any]]:
+        """Return a cached {"answer", "contexts"} result for the query, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(self._key(query))
+            if entry is not None:
+                return entry["result"]
+            entries = [e for e in self._entries.values() if e.get("namespace", "") == self.namespace]
+        if not entries:
+            return None
+
+        query_embedding = self.embed_model.get_query_embedding(normalize_query(query))
+        best_similarity, best_entry = max(
+            ((_cosine(query_embedding, e["embedding"]), e) for e in entries),
+            key=lambda pair: pair[0],
+        )
+
+        if best_similarity >= EXACT_HIT_SIMILARITY:
+            return best_entry["result"]
+
+        if best_similarity >= PARAPHRASE_HIT_SIMILARITY:
+            new_evidence = evidence_signature(self.retrieve(query))
+            if _jaccard(new_evidence, set(best_entry["evidence"])) >= MIN_EVIDENCE_JACCARD:
+                return best_entry["result"]
+
+        return None
+
+    def store(self, query: str, result: Dict[str, Any], retrieved_context: Optional[str] = None):
+        """
+        Cache a pipeline result together with the query embedding and its retrieval evidence.
+        Pass the Document Retrieval Tool output the pipeline already got to avoid running retrieval
+        a second time - it must come from the same source as retrieve() so the signatures compare.
+        """
+        if retrieved_context is None:
+            retrieved_context = self.retrieve(query)
+        entry = {
+            "query": query,
+            "namespace": self.namespace,
+            "embedding": self.embed_model.get_query_embedding(normalize_query(query)),
+            "evidence": sorted(evidence_signature(retrieved_context)),
+            "result": result,
+        }
+        with self._lock:
+            self._entries[self._key(query)] = entry
+            self._save()
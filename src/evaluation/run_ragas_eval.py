@@ -1,8 +1,12 @@
 import os
 import sys
 import asyncio
+import hashlib
+import orjson
+import pandas as pd
 from datasets import Dataset
 from ragas import evaluate
+from ragas.run_config import RunConfig
 from ragas.metrics import (
     faithfulness,
     answer_relevancy,
@@ -17,14 +21,36 @@ from llama_index.embeddings.ollama import OllamaEmbedding
 #from ragas.integrations.llama_index import LlamaIndexLLM as RagasLlamaIndexLLM
 from ragas.llms import LlamaIndexLLMWrapper
 from ragas.embeddings import LlamaIndexEmbeddingsWrapper
+
+# Optional in-process INT8 embedder for the RAGAS metrics (pip install llama-index-embeddings-huggingface-optimum-intel)
+try:
+    from llama_index.embeddings.huggingface_optimum_intel import IntelEmbedding
+except ImportError:
+    IntelEmbedding = None
+
+# Optional OpenAI-compatible client for a local vLLM judge server (pip install llama-index-llms-openai-like)
+try:
+    from llama_index.llms.openai_like import OpenAILike
+except ImportError:
+    OpenAILike = None
                                                                    #Added to avoid OPEN_API_KEY error due to default OpenAI model fallback 
 
 # Add the project root to the Python path to allow importing from 'src'
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
 sys.path.insert(0, project_root)
 
+# Keep CrewAI quiet during evaluation - concurrent crews would otherwise contend on stdout
+os.environ.setdefault("CREW_VERBOSE", "0")
+
 # Now you can import from your modules
-from src.rag_system.crew import create_rag_crew
+from src.rag_system.crew import run_rag_query
+from src.rag_system.agents import formatted_arize_phoenix_sytemm_prompt
+from src.rag_system.tools import document_retrieval_tool, reset_last_retrieval, get_last_retrieval
+from src.rag_system.http_client import (
+    get_ollama_client, share_ollama_client,
+    OLLAMA_NUM_CTX, OLLAMA_LLM_MODEL, OLLAMA_KEEP_ALIVE, OLLAMA_EMBED_MODEL,
+)
+from src.evaluation.answer_cache import GroundedAnswerCache
 
 # --- Configuration ---
 # Load environment variables from .env file
@@ -33,13 +59,58 @@ load_dotenv()
 # Specify the path to your golden dataset
 EVAL_DATASET_PATH = os.path.join(project_root, 'src', 'evaluation', 'eval_dataset.jsonl')
 
-def run_rag_pipeline(query: str):
+# Number of questions run through the crew at the same time - keep in line with the Ollama server's OLLAMA_NUM_PARALLEL
+EVAL_CONCURRENCY = int(os.getenv("OLLAMA_NUM_PARALLEL", "4"))
+
+# Optional vLLM judge for the RAGAS metrics, e.g. started with:
+#   vllm serve neuralmagic/Meta-Llama-3.1-8B-Instruct-FP8 --kv-cache-dtype fp8 --max-model-len 8192 --gpu-memory-utilization 0.9
+# vLLM continuous-batches the many short judge prompts far better than Ollama. Leave unset to judge with Ollama.
+# FP8 weights + FP8 KV cache halve the bytes per token, so the server holds about twice as many concurrent judge calls.
+# On GPUs without FP8 support serve an AWQ/GPTQ W4A16 checkpoint instead and set RAGAS_JUDGE_MODEL accordingly.
+RAGAS_JUDGE_API_BASE = os.getenv("RAGAS_JUDGE_API_BASE")   # e.g. http://localhost:8000/v1
+RAGAS_JUDGE_MODEL = os.getenv("RAGAS_JUDGE_MODEL", "neuralmagic/Meta-Llama-3.1-8B-Instruct-FP8")
+
+# Number of RAGAS metric LLM calls kept in flight at once (LlamaIndexLLMWrapper dispatches them via acomplete)
+# vLLM continuous-batches the judge calls, so it gets twice ragas' default of 16. The Ollama judge keeps
+# ragas' default. RAGAS_MAX_WORKERS overrides either.
+RAGAS_MAX_WORKERS = os.getenv("RAGAS_MAX_WORKERS", "32" if RAGAS_JUDGE_API_BASE else None)
+
+# Optional INT8 static-quantized ONNX embedder for answer_relevancy, e.g. Intel/bge-small-en-v1.5-rag-int8-static
+# (needs optimum-intel). Off unless set: answer_relevancy scores are only comparable across runs that used
+# the same embedder, so it must not change with whatever happens to be installed. Default is the Ollama embedder.
+RAGAS_EMBED_MODEL = os.getenv("RAGAS_EMBED_MODEL")
+
+# Grounded answer cache persisted across runs - repeated/paraphrased questions skip the crew.
+# Off by default: a cached answer re-scores the pipeline that produced it, not the current one.
+# Enable with RAGAS_ANSWER_CACHE=1 only for repeated runs against an unchanged pipeline.
+ANSWER_CACHE_ENABLED = os.getenv("RAGAS_ANSWER_CACHE", "0") == "1"
+ANSWER_CACHE_PATH = os.path.join(project_root, 'src', 'evaluation', 'answer_cache.json')
+
+def answer_cache_namespace() -> str:
+    """Fingerprint of the model/prompt configuration - cached answers are only reused under the same one."""
+    config = "\n".join([
+        OLLAMA_LLM_MODEL,
+        OLLAMA_EMBED_MODEL,
+        os.getenv("RAG_SYNTHESIS_SHORTCUT", ""),
+        formatted_arize_phoenix_sytemm_prompt,
+    ])
+    return hashlib.sha1(config.encode("utf-8")).hexdigest()
+
+def run_rag_pipeline(query: str, answer_cache: GroundedAnswerCache = None):
     """
     A wrapper function to run the CrewAI RAG pipeline and return the final result.
+    If an answer_cache is given, cached answers are returned for repeated or
+    paraphrased queries whose retrieved evidence still matches.
     """
     try:
-        rag_crew = create_rag_crew(query)
-        result = rag_crew.kickoff()
+        if answer_cache is not None:
+            cached = answer_cache.lookup(query)
+            if cached is not None:
+                print(f"  - Answer cache hit for query: '{query[:80]}...'")
+                return cached
+
+        reset_last_retrieval()
+        result = run_rag_query(query)
         
         # --- FIX: Convert the CrewAI output object to a plain string ---
         # The 'datasets' library expects simple data types like strings, not complex objects.
@@ -53,7 +124,15 @@ def run_rag_pipeline(query: str):
         answer = answer_string
         contexts = [answer_string] # Use the string version here as well
 
-        return {"answer": answer, "contexts": contexts}
+        pipeline_output = {"answer": answer, "contexts": contexts}
+        if answer_cache is not None:
+            # Reuse the tool output captured during the crew run as the evidence (same format as the
+            # lookup's retrieve()). run_rag_query clears the crew's tool cache before kickoff, so a tool
+            # cache hit always follows a real call in this run and the context is set. It is only None when
+            # the researcher answered without the tool; store() then runs the query's only retrieval.
+            answer_cache.store(query, pipeline_output, retrieved_context=get_last_retrieval())
+
+        return pipeline_output
     except Exception as e:
         print(f"Error running crew for query '{query}': {e}")
         return {"answer": "Error", "contexts": []}
@@ -70,16 +149,22 @@ async def main():
 
     # Initialize the embedding model - use environment variable for base URL to support Docker 
     ollama_base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-    embed_model = OllamaEmbedding(
-            model_name="nomic-embed-text:v1.5", 
+    # Both models share the process-wide Ollama connection pool with the retrieval tool
+    embed_model = share_ollama_client(OllamaEmbedding(
+            model_name=OLLAMA_EMBED_MODEL,
             base_url=ollama_base_url,
             request_timeout=120.0  # Increased timeout for slower connections
-            )
+            ))
 
     # Configure the local LLM to prevent fallback to OpenAI
     # Be sure you have a local LLM model running, e.g., 'llama3' or 'gemma3:4b'
-    ollama_llm = Ollama(model="gemma3:4b",
+    # Use the same model tag and keep_alive as the crew agents so the judge calls hit the
+    # already loaded model instead of loading a second one (the judge prompts differ, so no prefix reuse)
+    ollama_llm = Ollama(model=OLLAMA_LLM_MODEL,
                         base_url=ollama_base_url,
+                        client=get_ollama_client(ollama_base_url),  # Shared connection pool
+                        keep_alive=OLLAMA_KEEP_ALIVE,
+                        context_window=OLLAMA_NUM_CTX,  # Same num_ctx as the crew LLM, otherwise Ollama reloads the model
                         request_timeout=120.0  # Increased timeout for slower connections
                         )
 
@@ -88,53 +173,106 @@ async def main():
     Settings.llm = ollama_llm
     Settings.embed_model = embed_model
 
-    # Wrap the Ollama LLM instance in the Ragas LlamaIndex wrapper.
-    #ragas_ollama_llm = RagasLlamaIndexLLM(llama_index_llm=ollama_llm)
-    #ragas_ollama_llm = LlamaIndexLLMWrapper(llama_index_llm=ollama_llm)
-    ragas_ollama_llm = LlamaIndexLLMWrapper(llm=ollama_llm)
-    ragas_ollama_embed_model = LlamaIndexEmbeddingsWrapper(embeddings=embed_model)
+    # Use the vLLM server as the RAGAS judge if configured, otherwise the Ollama LLM
+    if RAGAS_JUDGE_API_BASE:
+        if OpenAILike is None:
+            print("❌ Error: RAGAS_JUDGE_API_BASE is set but llama-index-llms-openai-like is not installed")
+            return
+        judge_llm = OpenAILike(
+            api_base=RAGAS_JUDGE_API_BASE,
+            model=RAGAS_JUDGE_MODEL,
+            api_key=os.getenv("RAGAS_JUDGE_API_KEY", "EMPTY"),  # vLLM does not check the key unless started with --api-key
+            is_chat_model=True,
+            timeout=120.0,
+        )
+        print(f"⚖️  Using vLLM judge '{RAGAS_JUDGE_MODEL}' at {RAGAS_JUDGE_API_BASE}")
+    else:
+        judge_llm = ollama_llm
+
+    # Wrap the judge LLM instance in the Ragas LlamaIndex wrapper.
+    #ragas_judge_llm = RagasLlamaIndexLLM(llama_index_llm=judge_llm)
+    #ragas_judge_llm = LlamaIndexLLMWrapper(llama_index_llm=judge_llm)
+    ragas_judge_llm = LlamaIndexLLMWrapper(llm=judge_llm)
+    # answer_relevancy issues many embedding calls - with RAGAS_EMBED_MODEL set they run in-process on a
+    # quantized model instead of an HTTP round-trip to Ollama per call. Generation stays on Ollama.
+    if RAGAS_EMBED_MODEL:
+        if IntelEmbedding is None:
+            print(f"❌ Error: RAGAS_EMBED_MODEL={RAGAS_EMBED_MODEL} needs llama-index-embeddings-huggingface-optimum-intel")
+            return
+        ragas_embed_model = IntelEmbedding(RAGAS_EMBED_MODEL)
+        print(f"📐 answer_relevancy embedder: {RAGAS_EMBED_MODEL} (optimum-intel INT8)")
+    else:
+        ragas_embed_model = embed_model
+        print(f"📐 answer_relevancy embedder: {embed_model.model_name} (Ollama)")
+    ragas_ollama_embed_model = LlamaIndexEmbeddingsWrapper(embeddings=ragas_embed_model)
 
-    # Assign Ollama models to Ragas metrics
+    # Assign the judge/embedding models to Ragas metrics
 
     # Set the wrapped LLM for the specific Ragas faithfulness metric.
     # This overrides the default LLM used by the faithfulness evaluation.
 
-    faithfulness.llm = ragas_ollama_llm
-    answer_relevancy.llm = ragas_ollama_llm
-    context_precision.llm = ragas_ollama_llm
-    context_recall.llm = ragas_ollama_llm
+    faithfulness.llm = ragas_judge_llm
+    answer_relevancy.llm = ragas_judge_llm
+    context_precision.llm = ragas_judge_llm
+    context_recall.llm = ragas_judge_llm
     answer_relevancy.embeddings = ragas_ollama_embed_model
+
+    answer_cache = None
+    if ANSWER_CACHE_ENABLED:
+        answer_cache = GroundedAnswerCache(
+            path=ANSWER_CACHE_PATH,
+            embed_model=embed_model,
+            retrieve=lambda q: document_retrieval_tool.run(q),
+            namespace=answer_cache_namespace(),
+        )
                                                                    #Added to avoid OPEN_API_KEY error due to default OpenAI model fallback
 
 
-    # Load the golden dataset from the .jsonl file
-    golden_dataset = Dataset.from_json(EVAL_DATASET_PATH)
+    # Load the golden dataset from the .jsonl file line by line - only question/ground_truth are needed,
+    # the HF Dataset is built once at the end because RAGAS needs it as input
+    with open(EVAL_DATASET_PATH, 'rb') as f:
+        golden_df = pd.DataFrame(
+            [orjson.loads(line) for line in f if line.strip()],
+            columns=["question", "ground_truth"],
+        )
 
     # --- Run the RAG pipeline for each question in the dataset ---
+    # Questions are submitted concurrently so the Ollama server can batch them;
+    # the semaphore keeps the number of in-flight crews at OLLAMA_NUM_PARALLEL.
+    # Each worker thread runs its own crew with its own Agent instances (see get_rag_crew).
     print("\n🚀 Running RAG pipeline on the evaluation dataset...")
-    results = []
-    questions = []
-    ground_truths = []
-    
-    for entry in golden_dataset:
-        question = entry['question']
-        ground_truth = entry['ground_truth']
-        
-        print(f"  - Processing question: '{question[:80]}...'")
-        pipeline_output = run_rag_pipeline(question)
-        
-        results.append(pipeline_output)
-        questions.append(question)
-        ground_truths.append(ground_truth)
+    sem = asyncio.Semaphore(EVAL_CONCURRENCY)
+
+    async def run_one(question):
+        async with sem:
+            print(f"  - Processing question: '{question[:80]}...'")
+            return await asyncio.to_thread(run_rag_pipeline, question, answer_cache)
+
+    # gather() keeps the input order, so the outputs line up with the DataFrame rows
+    results = await asyncio.gather(*(run_one(question) for question in golden_df["question"]))
 
     # --- Prepare the dataset for RAGAS evaluation ---
-    evaluation_data = {
-        "question": questions,
-        "answer": [res["answer"] for res in results],
-        "contexts": [res["contexts"] for res in results],
-        "ground_truth": ground_truths,
-    }
-    eval_dataset = Dataset.from_dict(evaluation_data)
+    eval_df = golden_df.assign(
+        answer=[res["answer"] for res in results],
+        contexts=[res["contexts"] for res in results],
+    )
+
+    # Drop rows where the crew failed instead of letting the "Error" answers score 0 silently
+    failed_rows = eval_df["answer"] == "Error"
+    if failed_rows.any():
+        print(f"⚠️  {int(failed_rows.sum())} of {len(eval_df)} questions failed and are excluded from the evaluation:")
+        for question in eval_df.loc[failed_rows, "question"]:
+            print(f"  - {question[:80]}...")
+        eval_df = eval_df.loc[~failed_rows]
+
+    if eval_df.empty:
+        print("❌ Error: No successful pipeline runs to evaluate")
+        return
+
+    eval_dataset = Dataset.from_pandas(
+        eval_df[["question", "answer", "contexts", "ground_truth"]],
+        preserve_index=False,
+    )
 
     # --- Run the RAGAS evaluation ---
     print("\n📊 Evaluating the results with RAGAS...")
@@ -147,11 +285,16 @@ async def main():
         context_precision,  # Was the retrieved context precise and not full of noise?
     ]
 
+    # The metric calls have no data dependency on each other, so let Ragas dispatch
+    # them concurrently and leave the batching to the Ollama server
+    run_config = RunConfig(max_workers=int(RAGAS_MAX_WORKERS)) if RAGAS_MAX_WORKERS else RunConfig()
+
     # Run the evaluation it return an object of type EvaluationResult 
     result = evaluate(
         dataset=eval_dataset,
         metrics=metrics,
-        llm=ragas_ollama_llm # Pass the Ragas-wrapped Ollama LLM to the evaluation
+        llm=ragas_judge_llm, # Pass the Ragas-wrapped judge LLM to the evaluation
+        run_config=run_config,
     )
 
     print("\n🎉 Evaluation Complete!")
@@ -1,6 +1,12 @@
 import os
+import json
+import time
+import hashlib
+import functools
 from crewai import Agent, LLM
+from crewai.utilities.prompts import Prompts
 from .tools import document_retrieval_tool
+from .http_client import OLLAMA_NUM_CTX, OLLAMA_LLM_MODEL, OLLAMA_KEEP_ALIVE
 
 from phoenix.client import Client
 from phoenix.client.types import PromptVersion
@@ -17,44 +23,113 @@ print(f"DEBUG: OLLAMA_BASE_URL_VAR : {repr(OLLAMA_BASE_URL_VAR)}")
 PHOENIX_COLLECTOR_ENDPOINT_VAR = os.getenv("PHOENIX_COLLECTOR_ENDPOINT")#if docker then http://host.docker.internal:6006 from .env.docker ELSE http://localhost:6006 from .evn 
 print(f"DEBUG: PHOENIX_COLLECTOR_ENDPOINT_VAR : {repr(PHOENIX_COLLECTOR_ENDPOINT_VAR)}")
 
+# CrewAI verbose output is synchronous stdout I/O on the agent loop - off unless CREW_VERBOSE=1
+CREW_VERBOSE = os.getenv("CREW_VERBOSE", "0") == "1"
+
 
 #Initialize the Phoenix client
 phoenix_client = Client(base_url=PHOENIX_COLLECTOR_ENDPOINT_VAR)
 
+# Formatted Phoenix prompts are cached on disk so every new worker process does not pay the
+# network fetch, and crew creation keeps working while Phoenix is down (stale copy is used)
+PHOENIX_PROMPT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "agentic_rag", "phoenix_prompts")
+PHOENIX_PROMPT_CACHE_TTL = 24 * 60 * 60  # seconds
+
+
+@functools.lru_cache(maxsize=4)
+def _get_system_prompt(prompt_identifier: str, variables_json: str) -> str:
+    """Returns the formatted system message of a Phoenix prompt, using the on-disk cache when fresh."""
+    variables = json.loads(variables_json)
+    variables_hash = hashlib.sha256(variables_json.encode("utf-8")).hexdigest()
+    cache_path = os.path.join(PHOENIX_PROMPT_CACHE_DIR, f"{prompt_identifier}.json")
+
+    # A missing, truncated or hand-edited cache file just means fetching from Phoenix
+    cached = None
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("variables_hash") != variables_hash or not isinstance(cached["content"], str):
+            cached = None
+        elif time.time() - float(cached.get("fetched_at", 0)) < PHOENIX_PROMPT_CACHE_TTL:
+            return cached["content"]
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        cached = None
+
+    try:
+        retrieved_prompt = phoenix_client.prompts.get(prompt_identifier=prompt_identifier)
+        # Stripped so the system text is byte-stable across fetches - Ollama's prompt cache only
+        # matches an identical token prefix (see warm_up_prompt_cache)
+        content = retrieved_prompt.format(variables=variables).messages[0]["content"].strip()
+    except Exception as e:
+        if cached:
+            print(f"Warning: Could not fetch Phoenix prompt '{prompt_identifier}', using cached copy: {e}")
+            return cached["content"]
+        raise
+
+    try:
+        os.makedirs(PHOENIX_PROMPT_CACHE_DIR, exist_ok=True)
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump({"fetched_at": time.time(), "variables_hash": variables_hash, "content": content}, f)
+    except OSError as e:
+        print(f"Warning: Could not write Phoenix prompt cache {cache_path}: {e}")
+    return content
+
+
+# Both agents share this LLM, so they run on the same weights (OLLAMA_LLM_MODEL, see http_client).
+# keep_alive is how long Ollama keeps the model (and with it the slot's prompt cache) loaded after a request.
+# Only litellm's ollama_chat/ route (/api/chat) sends keep_alive as a top-level request field - the
+# ollama/ route (/api/generate) folds unknown kwargs into "options", where Ollama ignores it.
 ollama_llm = LLM(
-    model="ollama/gemma3:4b",  # Using a larger model for better context understanding
+    model=f"ollama_chat/{OLLAMA_LLM_MODEL}",  # /api/chat so keep_alive is honoured
     #base_url=ollama_base_url,
     base_url=OLLAMA_BASE_URL_VAR,
     temperature=1,
     timeout=300,
-    verbose=True,  # Enable verbose logging for debugging
-    # Maximum token configuration for gemma3:4b
-    max_tokens=131072,  # Use maximum context length available
-    num_ctx=131072,     # Context window size
+    keep_alive=OLLAMA_KEEP_ALIVE,
+    verbose=CREW_VERBOSE,  # Set CREW_VERBOSE=1 to enable verbose logging for debugging
+    # Token configuration sized to the real workload (prompt + a few retrieved chunks)
+    # KV cache memory grows linearly with num_ctx, so keep it close to what is actually used
+    max_tokens=2048,    # Synthesized answers rarely exceed this
+    num_ctx=OLLAMA_NUM_CTX,  # Context window size - shared with the LlamaIndex Ollama instances (see http_client)
+)
+
+# Prompt-cache warm-up only needs the prefill, not an answer: same model and num_ctx as ollama_llm
+# (a different num_ctx would make Ollama reload the model) but a single greedy output token
+ollama_warmup_llm = LLM(
+    model=f"ollama_chat/{OLLAMA_LLM_MODEL}",
+    base_url=OLLAMA_BASE_URL_VAR,
+    temperature=0,
+    timeout=300,
+    keep_alive=OLLAMA_KEEP_ALIVE,
+    max_tokens=1,
+    num_ctx=OLLAMA_NUM_CTX,
 )
 
 # --- AGENT 1: The Specialist Retriever ---
 # This agent's only job is to call the retrieval tool correctly.
-document_researcher = Agent(
-    role='Document Researcher',
-    goal='Prioritize your internal memory knowledge first to get the relevant information for the user\'s query. if NO relevant information found in memory, then always Use the Document Retrieval Tool to find information relevant to a user\'s query from the knowledge base.',
-    backstory=(
-   "You are an information retrieval specialist with an exceptional memory. Your role is strictly limited to:, "
-   "1) Analyze the user's query to understand intent, "
-   "2) You alwyas check your internal memory and existing knowledge before using any tool,"
-   "3) if no relevant information found in the memory , then make use of tool for retrieving relevant information, "
-   "4) Retrieve relevant text chunks using the Document Retrieval Tool, "
-   "5) Return two things (i) source document name and (ii) only the raw retrieved context - no interpretation or answers. "
-   "DO NOT answer questions using your general knowledge. "
-   "DO NOT provide explanations, summaries, or interpretations. "
-),
-    tools=[document_retrieval_tool],
-    llm=ollama_llm,
-    verbose=True,
-    memory=True,
-    allow_delegation=False,
-    max_iter=3,  # Limit iterations to prevent infinite loops
-)
+# Agents are built per crew (see create_rag_crew): kickoff() binds agent.crew and execute_task()
+# stores its executor on the agent, so concurrent crews must never share an Agent instance.
+def create_document_researcher() -> Agent:
+    return Agent(
+        role='Document Researcher',
+        goal='Prioritize your internal memory knowledge first to get the relevant information for the user\'s query. if NO relevant information found in memory, then always Use the Document Retrieval Tool to find information relevant to a user\'s query from the knowledge base.',
+        backstory=(
+       "You are an information retrieval specialist with an exceptional memory. Your role is strictly limited to:, "
+       "1) Analyze the user's query to understand intent, "
+       "2) You alwyas check your internal memory and existing knowledge before using any tool,"
+       "3) if no relevant information found in the memory , then make use of tool for retrieving relevant information, "
+       "4) Retrieve relevant text chunks using the Document Retrieval Tool, "
+       "5) Return two things (i) source document name and (ii) only the raw retrieved context - no interpretation or answers. "
+       "DO NOT answer questions using your general knowledge. "
+       "DO NOT provide explanations, summaries, or interpretations. "
+    ),
+        tools=[document_retrieval_tool],
+        llm=ollama_llm,
+        verbose=CREW_VERBOSE,
+        memory=True,
+        allow_delegation=False,
+        max_iter=3,  # Limit iterations to prevent infinite loops
+    )
 
 #   "ONLY return the exact text chunks along with the source document name retrieved from the tool for the next agent to use."
 # --- AGENT 2: The Specialist Synthesizer ---
@@ -65,9 +140,6 @@ custom_prompt_template = """Task: {input}
 Please complete this task thoughtfully."""
 
 
-# Retrieve the latest version of the SYSTEN prompt
-retrieved_arize_phoenix_sytemm_prompt = phoenix_client.prompts.get(prompt_identifier="insight-generation-system-prompt-template-v1")
-
 # Define the values for your variables
 variable_values = {
     "role": "Insight Synthesizer",
@@ -97,28 +169,65 @@ variable_values = {
                    - Maintain professional tone while being conversational "
 }
 
-# Format the prompt with the variable values
-formatted_arize_phoenix_sytemm_prompt = retrieved_arize_phoenix_sytemm_prompt.format(variables=variable_values)
+# Retrieve the latest version of the SYSTEN prompt and format it with the variable values (cached, see _get_system_prompt)
+# The result is the system message content, ready to be passed to your LLM API
+formatted_arize_phoenix_sytemm_prompt = _get_system_prompt(
+    "insight-generation-system-prompt-template-v1",
+    json.dumps(variable_values, sort_keys=True),
+)
+#print(f"DEBUG : formatted_prompt = {formatted_arize_phoenix_sytemm_prompt}")
 
-# The formatted_prompt object is now ready to be passed to your LLM API
-# It contains the full list of messages with your variables filled in.
-#print(f"DEBUG : formatted_prompt.message = {formatted_prompt.messages}")
 
+def create_insight_synthesizer() -> Agent:
+    return Agent(
+            role=variable_values["role"],
+            goal=variable_values["goal"],
+            backstory=variable_values["backstory"],
+            system_template=formatted_arize_phoenix_sytemm_prompt,
+            prompt_template=custom_prompt_template,
+            use_system_prompt=True, # Use separate system/user messages
+            llm=ollama_llm,
+            verbose=CREW_VERBOSE,
+            allow_delegation=False,
+            max_iter=3,  # Limit iterations to prevent infinite loops
+            #memory=True,
+            tools =[] # This agent does not need tools; it only processes text.
+    )
 
-insight_synthesizer = Agent(
-        role=variable_values["role"],
-        goal=variable_values["goal"],
-        backstory=variable_values["backstory"],
-        system_template=formatted_arize_phoenix_sytemm_prompt.messages[0]["content"],
-        prompt_template=custom_prompt_template,
-        use_system_prompt=True, # Use separate system/user messages
-        llm=ollama_llm,
-        verbose=True,
-        allow_delegation=False,
-        max_iter=3,  # Limit iterations to prevent infinite loops
-        #memory=True,
-        tools =[] # This agent does not need tools; it only processes text.
-)
+
+def warm_up_prompt_cache(agent: Agent) -> None:
+    """
+    Sends one short request whose messages start with the agent's static prefix (system template with
+    role/goal/backstory filled in, built the same way CrewAI builds it) so the first crew request
+    already finds that prefix in Ollama's prompt cache and only the task part is prefilled.
+    The messages mirror CrewAI's executor: a system message plus a user message when the agent
+    uses a system prompt, otherwise one user message - /api/chat templates them into the same prefix.
+    """
+    try:
+        prompt = Prompts(
+            agent=agent,
+            has_tools=len(agent.tools or []) > 0,
+            i18n=agent.i18n,
+            use_system_prompt=agent.use_system_prompt,
+            system_template=agent.system_template,
+            prompt_template=agent.prompt_template,
+            response_template=agent.response_template,
+        ).task_execution()
+        if "system" in prompt:
+            messages = [
+                {"role": "system", "content": prompt["system"]},
+                {"role": "user", "content": f"{prompt['user'].split('{input}')[0]}ready?"},
+            ]
+        else:
+            messages = [{"role": "user", "content": f"{prompt['prompt'].split('{input}')[0]}ready?"}]
+        ollama_warmup_llm.call(messages)
+    except Exception as e:
+        print(f"Warning: Could not warm up the Ollama prompt cache: {e}")
+
+
+# Prefill the synthesizer's large static prompt once per process (keep_alive keeps it cached)
+if os.getenv("OLLAMA_PREFIX_WARMUP", "1") == "1":
+    warm_up_prompt_cache(create_insight_synthesizer())
 
 
 # This agent's only job is to write the final answer based on the context it receives.
@@ -1,42 +1,51 @@
 import os 
 import re
+import functools
+import threading
 import traceback 
 
 from crewai import Crew, Process, Task
-from .agents import document_researcher, insight_synthesizer
-from typing import Tuple, Any
+from crewai.tasks.conditional_task import ConditionalTask
+from crewai.agents.cache.cache_handler import CacheHandler
+from .agents import create_document_researcher, create_insight_synthesizer, CREW_VERBOSE
+from typing import Tuple, Any, Optional
 from crewai import TaskOutput
 
 from crewai.memory.long_term.long_term_memory import LongTermMemory
 from crewai.memory.short_term.short_term_memory import ShortTermMemory
 from crewai.memory.entity.entity_memory import EntityMemory
-from crewai.memory.storage.ltm_sqlite_storage import LTMSQLiteStorage
-from crewai.memory.storage.rag_storage import RAGStorage
+from .memory_storage import TunedLTMSQLiteStorage, BatchedRAGStorage
+from .http_client import OLLAMA_EMBED_MODEL
 
 from dotenv import load_dotenv
 
 
 
+# Guardrail patterns are compiled once at import instead of on every task output.
+# The national ID pattern is not anchored so IDs are also detected inside a longer answer.
+# Both are fused into one alternation so the content is scanned in a single pass;
+# the named group that matched decides the mask.
+CONFIDENTIAL_INFO_RE = re.compile(
+    r"(?P<ph>\+971\s?[5-9]\d\s?\d{7})"
+    r"|(?P<uid>784[ .-]?\d{4}[ .-]?\d{7}[ .-]?\d{1})"
+)
+CONFIDENTIAL_INFO_MASKS = {"ph": "****PH.NO****", "uid": "****UAE.ID****"}
+
+# Echo every guardrail input to stdout only when debugging (RAG_DEBUG=1) - the print blocks on the critical path
+RAG_DEBUG = os.getenv("RAG_DEBUG", "0") == "1"
+
+
 def check_for_confidential_info(result: TaskOutput) -> Tuple[bool, Any]:
     """Validate content for sensitive information like UAE phone numbers."""
-   
-    uae_phone_numbers_pattern = r"\+971\s?[5-9]\d\s?\d{7}"
-    uae_national_id_pattern = r"^784[ .-]?\d{4}[ .-]?\d{7}[ .-]?\d{1}$"
 
     try:
-        content_text = str(result)
+        # TaskOutput.raw already holds the text; only fall back to str() for other result types
+        raw = getattr(result, "raw", None)
+        content_text = raw if isinstance(raw, str) else str(result)
         
         # Debug: Log what we actually receive
         # print(f"DEBUG: Tool received content text as : {repr(content_text)}")
 
-        #if re.search(uae_phone_numbers_pattern, content_text):
-        #    return (False, "Confidential information (UAE_PHONE_NUMBER) detected. Content blocked.")
-        #elif re.search(uae_national_id_pattern, content_text):
-        #    return (False, "Confidential information (UAE_EMIRATES_ID) detected. Content blocked.")
-        #else:
-            # If no sensitive info is found, pass the content through
-        #    return (True, result)
-
 
         status_msg = "OK"
 		#msg_lst = []
@@ -44,22 +53,29 @@ def check_for_confidential_info(result: TaskOutput) -> Tuple[bool, Any]:
         content_redacted = False
 		
         # Debug: Log what we actually receive
-        print(f"DEBUG: Tool received content text as : {repr(content_text)}")
+        if RAG_DEBUG:
+            print(f"DEBUG: Tool received content text as : {repr(content_text)}")
+
+        # One subn() pass masks both kinds of confidential information and records which ones matched
+        matched_groups = set()
+
+        def _mask(match):
+            matched_groups.add(match.lastgroup)
+            return CONFIDENTIAL_INFO_MASKS[match.lastgroup]
 
-        if re.search(uae_phone_numbers_pattern, content_text):
-            masked_content_text1 = re.sub(uae_phone_numbers_pattern, "****PH.NO****", content_text)
+        masked_content_text, n_matches = CONFIDENTIAL_INFO_RE.subn(_mask, content_text)
+        if n_matches:
             content_redacted = True
+            content_text = masked_content_text
+
+        if "ph" in matched_groups:
             msg1 = "Confidential information (UAE_PHONE_NUMBER) detected. Content redacted by masking it."
             print(f"DEBUG: {repr(msg1)}")
             #msg_lst.append(msg1)
-            content_text = masked_content_text1
-			
-        if re.search(uae_national_id_pattern, content_text):
-            masked_content_text2 = re.sub(uae_national_id_pattern, "****UAE.ID****", content_text)
-            content_redacted = True
+
+        if "uid" in matched_groups:
             msg2 = "Confidential information (UAE_EMIRATES_ID) detected. Content redacted by masking it."
             #msg_lst.append(msg2)
-            content_text = masked_content_text2
 			
         if content_redacted:
             #status_msg = " | ".join(msg_lst)
@@ -72,28 +88,111 @@ def check_for_confidential_info(result: TaskOutput) -> Tuple[bool, Any]:
         return (False, "Unexpected error during validation")
 
 
-def create_rag_crew(query: str):
+# Synthesis shortcut: short research outputs that plainly contain the answer skip the synthesizer LLM call.
+# Opt-in (RAG_SYNTHESIS_SHORTCUT=1) until the thresholds below have been validated on the RAGAS golden set.
+SHORTCUT_ENABLED = os.getenv("RAG_SYNTHESIS_SHORTCUT", "0") == "1"
+SHORTCUT_MAX_TOKENS = 256       # Only consider research outputs shorter than this (whitespace tokens)
+SHORTCUT_MIN_SCORE = 0.8        # Fraction of the query's content terms the best sentence must contain
+SHORTCUT_MIN_NEW_TERMS = 3      # Content terms beyond the query's own the sentence must add (rules out query echoes)
+
+# Tool errors and "nothing found" replies are never returned as the final answer
+_NO_ANSWER_RE = re.compile(
+    r"^\s*(error\b|no relevant)"
+    r"|\b(could not|couldn't|can ?not|unable to) (find|locate|retrieve|answer)"
+    r"|\bno (relevant )?(information|documents?|context|results?|data)\b"
+    r"|\b(not found|not available|insufficient (information|context))\b",
+    re.IGNORECASE,
+)
+
+_WORD_RE = re.compile(r"\w+")
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how in is it of on or that the this to was what when "
+    "where which who why will with according under".split()
+)
 
+# Crews are built once per worker thread and reused for every query (see get_rag_crew)
+_thread_local = threading.local()
+
+
+def _content_terms(text: str) -> set:
+    return {w for w in _WORD_RE.findall(text.lower()) if w not in _STOPWORDS and len(w) > 2}
+
+
+def maybe_shortcut(research_output: str, query: str) -> Optional[str]:
     """
-    Creates a CrewAI instance with enhanced memory capabilities:
-    1. Long-term Memory: Persistent storage using SQLite
-    2. Short-term Memory: RAG-based memory for recent context
-    3. Entity Memory: Tracks and maintains information about specific entities
+    Returns the research output as the final answer (after the confidential info guardrail)
+    when it is short and one of its sentences covers the query's content terms while adding
+    content of its own, otherwise None. Error and "nothing found" outputs never qualify.
+    This is a cheap lexical check so easy questions do not pay for a second LLM generation.
     """
+    if not SHORTCUT_ENABLED or not research_output or not query:
+        return None
+    if len(research_output.split()) >= SHORTCUT_MAX_TOKENS:
+        return None
+    if _NO_ANSWER_RE.search(research_output):
+        return None
+
+    query_terms = _content_terms(query)
+    if not query_terms:
+        return None
+
+    best_score = 0.0
+    for sentence in _SENTENCE_SPLIT_RE.split(research_output):
+        sentence_terms = _content_terms(sentence)
+        # A sentence made of the query's own terms (an echo of the question) answers nothing
+        if len(sentence_terms - query_terms) < SHORTCUT_MIN_NEW_TERMS:
+            continue
+        best_score = max(best_score, len(query_terms & sentence_terms) / len(query_terms))
+    if best_score < SHORTCUT_MIN_SCORE:
+        return None
+
+    passed, content = check_for_confidential_info(research_output)
+    if not passed and content == "Unexpected error during validation":
+        return None
+    return str(content)
+
+
+def _needs_synthesis(research_output: TaskOutput) -> bool:
+    """ConditionalTask condition for the synthesis task - False when the research output can be returned directly."""
+    shortcut_answer = maybe_shortcut(research_output.raw, getattr(_thread_local, "query", None))
+    _thread_local.shortcut_answer = shortcut_answer
+    return shortcut_answer is None
+
+
+# Task prompts are static; the '{query}' slot is filled in by CrewAI from kickoff(inputs={"query": ...})
+_RESEARCH_DESC_TMPL = "First try to fetch highly contextually similar or exact information from the memory for query: '{query}',Otherwise Always find relevant information in the documents for the query: '{query}'."
+
+_SYNTH_DESC_TMPL = "Analyze the provided document context from the previous research step and formulate a comprehensive and accurate answer to the user's original question: '{query}'."
+
+_SYNTH_EXPECTED_OUTPUT = """A professional, well-structured response that directly answers the user's question. Format the response naturally and appropriately based on the content:
+
+Guidelines for response formatting:
+- Start with a clear, direct answer to the question
+- Provide supporting details, explanations, or calculations only when relevant
+- Include specific references to policy articles, sections, or documents when citing sources
+- Use natural language flow rather than rigid templates
+- Adapt the structure to fit the content (simple answers for simple questions, detailed breakdowns for complex ones)
+- Use proper formatting (bullet points, numbering, or paragraphs) as appropriate for the content
+- Ensure professional tone and clarity
+- Include precise figures, timeframes, and regulatory references where applicable
+- Always make sure source document information like name,page number is mentioend in the generated answer
+- Don't generate lenghty response with irrelevant information
+
+The response should feel conversational yet authoritative, avoiding repetitive headers unless the content genuinely requires structured breakdown."""
+
+
+@functools.lru_cache(maxsize=1)
+def _get_ollama_embedder_config():
     # Load environment variables from a .env file
     load_dotenv()
 
-    # Define the data directory for memory storage
-    os.environ["CREWAI_STORAGE_DIR"] = "/home/ec2-user/nbs-agentic-rag/CREW_AI_MEM_STORE/"
-    os.environ["DATA_DIR"] = "/home/ec2-user/nbs-agentic-rag/CREW_AI_MEM_STORE/DATA/db"
-
-    DATA_DIR = os.getenv("DATA_DIR")
     OLLAMA_BASE_URL_VAR = os.getenv("OLLAMA_BASE_URL")   #if docker then it should use http://host.docker.internal:11434 from .env.docker ELSE http://localhost:11434 from .evn
 
     ollama_embedder_config = {
             "provider": "ollama",
             "config":{
-                "model_name": "nomic-embed-text:v1.5",
+                "model_name": OLLAMA_EMBED_MODEL,  # Embedding model for the short-term/entity memory (see http_client)
                 #"url": "http://localhost:11434" # Optional: Specify if Ollama is not running on default URL
                 #"url": "http://host.docker.internal:11434" # Optional: Specify if Ollama is not running on default URL
                 "url": OLLAMA_BASE_URL_VAR # Optional: Specify if Ollama is not running on default URL
@@ -101,70 +200,109 @@ def create_rag_crew(query: str):
     }
 
     print(f"DEBUG: OLLAMA_BASE_URL_VAR : {repr(OLLAMA_BASE_URL_VAR)}")
+    return ollama_embedder_config
 
-    # Initialize memory components
-    long_term_memory = LongTermMemory(
-        storage=LTMSQLiteStorage(db_path=f"{DATA_DIR}/long_term_memory.db")
-    )
 
-    short_term_memory = ShortTermMemory(
-        storage=RAGStorage(
-            embedder_config=ollama_embedder_config,
-            path=f"{DATA_DIR}/short_term_memory.db",
-            type="short_term"
-        )
+_memory_storages_lock = threading.Lock()
+
+
+def _get_memory_storages():
+    """
+    Returns the process-wide (long_term, short_term, entity) memory storages, built on first use.
+    The SQLite files and RAG storages are opened once per process instead of once per crew; the storages
+    are thread-safe (per-thread SQLite connections, locked write queues). The Memory objects wrapping them
+    are built per crew (see create_rag_crew) - CrewAI assigns .agent/.task on them during every task, so
+    concurrent crews must not share them.
+    """
+    with _memory_storages_lock:
+        return _build_memory_storages()
+
+
+@functools.lru_cache(maxsize=1)
+def _build_memory_storages():
+    # Define the data directory for memory storage
+    os.environ["CREWAI_STORAGE_DIR"] = "/home/ec2-user/nbs-agentic-rag/CREW_AI_MEM_STORE/"
+    os.environ["DATA_DIR"] = "/home/ec2-user/nbs-agentic-rag/CREW_AI_MEM_STORE/DATA/db"
+
+    DATA_DIR = os.getenv("DATA_DIR")
+    ollama_embedder_config = _get_ollama_embedder_config()
+
+    long_term_storage = TunedLTMSQLiteStorage(db_path=f"{DATA_DIR}/long_term_memory.db")  # WAL + per-thread connection
+
+    # Short-term and entity memory writes are queued and embedded in one batch per task (see _flush_memory_writes)
+    # RAGStorage.__init__ already embeds a test string through this embedder, which loads the model
+    short_term_storage = BatchedRAGStorage(
+        embedder_config=ollama_embedder_config,
+        path=f"{DATA_DIR}/short_term_memory.db",
+        type="short_term"
     )
 
-    entity_memory = EntityMemory(
-        storage=RAGStorage(
-            embedder_config=ollama_embedder_config,
-            path=f"{DATA_DIR}/entity_memory.db",
-            type="entities"
-        )
+    entity_storage = BatchedRAGStorage(
+        embedder_config=ollama_embedder_config,
+        path=f"{DATA_DIR}/entity_memory.db",
+        type="entities"
     )
 
+    return long_term_storage, short_term_storage, entity_storage
+
+
+def create_rag_crew():
+
+    """
+    Creates a CrewAI instance with enhanced memory capabilities:
+    1. Long-term Memory: Persistent storage using SQLite
+    2. Short-term Memory: RAG-based memory for recent context
+    3. Entity Memory: Tracks and maintains information about specific entities
+    """
+    long_term_storage, short_term_storage, entity_storage = _get_memory_storages()
+
+    # Initialize memory components - per crew, over the process-wide storages
+    long_term_memory = LongTermMemory(storage=long_term_storage)
+    short_term_memory = ShortTermMemory(storage=short_term_storage)
+    entity_memory = EntityMemory(storage=entity_storage)
+
+    # Fresh agents for every crew - Agent objects hold per-run state (crew, agent_executor)
+    document_researcher = create_document_researcher()
+    insight_synthesizer = create_insight_synthesizer()
+    ollama_embedder_config = _get_ollama_embedder_config()
+
 
     """
     Creates and configures a three-agent RAG crew to process a query.
     - The Document Researcher finds relevant information.
     - The Insight Synthesizer formulates the final answer based on the retrieved context.
     - The Redactor Guardrail the final answer received from Synthesizer by excluding Personally Identifiable Information (PII like Name, Passport Number etc).
+    The task descriptions contain a '{query}' placeholder which CrewAI fills in from kickoff(inputs={"query": ...}),
+    so the same crew can be reused for every query.
     """
 
     # Task for the Document Researcher agent
     # This task focuses exclusively on using the tool to find information.
     research_task = Task(
-            description=f"First try to fetch highly contextually similar or exact information from the memory for query: '{query}',Otherwise Always find relevant information in the documents for the query: '{query}'.",
+        description=_RESEARCH_DESC_TMPL,
         expected_output="A block of text containing chunks of the most relevant document sections and respective source document file names.",
         agent=document_researcher
     )
 
     # Task for the Insight Synthesizer agent
     # This task takes the context from the first task and focuses on crafting the answer.
-    synthesis_task = Task(
-        description=f"Analyze the provided document context from {research_task} and formulate a comprehensive and accurate answer to the user's original question: '{query}'.",
-        expected_output="""A professional, well-structured response that directly answers the user's question. Format the response naturally and appropriately based on the content:
-
-Guidelines for response formatting:
-- Start with a clear, direct answer to the question
-- Provide supporting details, explanations, or calculations only when relevant
-- Include specific references to policy articles, sections, or documents when citing sources
-- Use natural language flow rather than rigid templates
-- Adapt the structure to fit the content (simple answers for simple questions, detailed breakdowns for complex ones)
-- Use proper formatting (bullet points, numbering, or paragraphs) as appropriate for the content
-- Ensure professional tone and clarity
-- Include precise figures, timeframes, and regulatory references where applicable
-- Always make sure source document information like name,page number is mentioend in the generated answer
-- Don't generate lenghty response with irrelevant information
-
-The response should feel conversational yet authoritative, avoiding repetitive headers unless the content genuinely requires structured breakdown.""",
+    # It is skipped when the research output already answers the query (see maybe_shortcut).
+    synthesis_task = ConditionalTask(
+        description=_SYNTH_DESC_TMPL,
+        expected_output=_SYNTH_EXPECTED_OUTPUT,
         agent=insight_synthesizer,
         context=[research_task], # This ensures it uses the output from the research_task
         guardrail=check_for_confidential_info, # Task level guardrail function.
         guardrail_max_retries=3, # Limit retry attempts
+        condition=_needs_synthesis,
     )
 
 
+    def _flush_memory_writes(_task_output: TaskOutput):
+        # Runs after every task - store the memory entries queued during that task in one batch
+        short_term_memory.storage.flush()
+        entity_memory.storage.flush()
+
     # Create the crew with a sequential process
     rag_crew = Crew(
         agents=[document_researcher, insight_synthesizer],
@@ -176,7 +314,55 @@ The response should feel conversational yet authoritative, avoiding repetitive h
         long_term_memory=long_term_memory,
         short_term_memory=short_term_memory,
         entity_memory=entity_memory,
-        verbose=True,
+        task_callback=_flush_memory_writes,
+        verbose=CREW_VERBOSE,
     )
 
     return rag_crew
+
+
+def get_rag_crew() -> Crew:
+    """
+    Returns the RAG crew of the calling thread, building it on first use.
+    This skips re-creating the agents and tasks for every query; the memory storages are shared
+    process-wide (see _get_memory_storages). Crews are kept per thread because kickoff() mutates the state
+    of the crew's tasks and agents, and every crew owns its own Agent instances (see create_rag_crew).
+    """
+    rag_crew = getattr(_thread_local, "rag_crew", None)
+    if rag_crew is None:
+        rag_crew = create_rag_crew()
+        _thread_local.rag_crew = rag_crew
+    return rag_crew
+
+
+def _reset_crew_state(rag_crew: Crew) -> None:
+    """
+    Clears the per-query state a kickoff leaves on a reused crew. CrewAI never resets Task.retry_count,
+    so without this guardrail_max_retries would be a budget for the thread's lifetime instead of per query,
+    and the tool cache (cache=True) would keep serving the previous queries' tool results.
+    Written against crewai==0.201.1 (nbs_rag_api_requirements.txt) - recheck on upgrades.
+    """
+    for task in rag_crew.tasks:
+        task.retry_count = 0
+        task.output = None
+
+    # Fresh tool cache per query; set_cache_handler() hands it to the agents' tools handlers like Crew does
+    cache_handler = CacheHandler()
+    rag_crew._cache_handler = cache_handler
+    for agent in rag_crew.agents:
+        agent.set_cache_handler(cache_handler)
+
+
+def run_rag_query(query: str):
+    """Runs the (reused) RAG crew for a single query and returns the CrewOutput."""
+    _thread_local.query = query
+    _thread_local.shortcut_answer = None
+
+    rag_crew = get_rag_crew()
+    _reset_crew_state(rag_crew)
+    crew_output = rag_crew.kickoff(inputs={"query": query})
+
+    # The synthesis task was skipped - the final answer is the guardrail-checked research output
+    if _thread_local.shortcut_answer is not None:
+        crew_output.raw = _thread_local.shortcut_answer
+    return crew_output
@@ -0,0 +1,77 @@
+import functools
+import os
+from typing import Any
+
+import httpx
+from dotenv import load_dotenv
+from ollama import Client
+
+
+# The model settings below are read at import, so .env must be loaded first
+load_dotenv()
+
+# One keep-alive connection pool per Ollama server, shared by every LlamaIndex Ollama
+# embedder/LLM in the process instead of one HTTP client (and TCP connect) per instance.
+# Sized for RAGAS max_workers of 16-32 plus the concurrent crew runs.
+OLLAMA_HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+OLLAMA_HTTP_TIMEOUT = 120.0
+
+# Context window (num_ctx) for every caller of the chat model: the crew LLM, the retrieval tool's and the
+# eval judge's LlamaIndex Ollama. Ollama reloads the runner whenever a request's num_ctx differs from the
+# loaded one, so all of them must send the same value. Sized to prompt + a few retrieved chunks.
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "8192"))
+
+# Chat and embedding model tags and keep_alive, defined once for every caller (crew agents, retrieval tool,
+# crew memory, ingestion, eval judge). A caller asking for a different tag or keep_alive makes Ollama load
+# a second model or unload the resident one.
+# Both agents run on OLLAMA_LLM_MODEL (pre-pull with `ollama pull gemma3:4b-it-q4_K_M`). Ollama's plain gemma3:4b
+# tag already resolves to this Q4_K_M build - the explicit tag is a reproducibility pin so a re-tagged default
+# can't silently change the model. gemma3:4b-it-q8_0 trades speed for quality.
+OLLAMA_LLM_MODEL = os.getenv("OLLAMA_LLM_MODEL", "gemma3:4b-it-q4_K_M")
+# Setting OLLAMA_KEEP_ALIVE on the Ollama server itself gives the same default for every client.
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Same embedding model for ingestion, retrieval and the crew memory - can point at an INT8 (q8_0) quant of
+# nomic-embed-text, e.g. `ollama create nomic-embed-text:v1.5-q8_0 --quantize q8_0 -f <Modelfile FROM nomic-embed-text:v1.5>`
+OLLAMA_EMBED_MODEL = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text:v1.5")
+
+
+@functools.lru_cache(maxsize=None)
+def get_ollama_client(base_url: str) -> Client:
+    """Returns the process-wide Ollama client (and its connection pool) for base_url."""
+    return Client(host=base_url, timeout=OLLAMA_HTTP_TIMEOUT, limits=OLLAMA_HTTP_LIMITS)
+
+
+def share_ollama_client(model: Any) -> Any:
+    """
+    Points a LlamaIndex OllamaEmbedding at the shared sync client for its base_url (it takes no client
+    argument). The LlamaIndex Ollama LLM accepts client=get_ollama_client(base_url) directly.
+    Async clients are left per instance since an httpx.AsyncClient is bound to the event loop it first ran on.
+    """
+    model._client = get_ollama_client(model.base_url)
+    return model
+
+
+# (base_url, model_name) pairs already loaded - only successful warm-ups are recorded, so a failed one
+# (e.g. Ollama not up yet) is retried on the next call
+_warmed_embed_models = set()
+
+
+def warm_up_embed_model(base_url: str, model_name: str) -> bool:
+    """
+    Loads an Ollama embedding model once per process over the shared client, so the first real
+    request does not pay the cold model load. keep_alive keeps it resident between requests.
+    """
+    key = (base_url, model_name)
+    if key in _warmed_embed_models:
+        return True
+    try:
+        get_ollama_client(base_url).embed(
+            model=model_name,
+            input="warmup",
+            keep_alive=OLLAMA_KEEP_ALIVE,
+        )
+    except Exception as e:
+        print(f"Warning: Could not warm up Ollama model: {e}")
+        return False
+    _warmed_embed_models.add(key)
+    return True
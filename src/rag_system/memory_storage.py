@@ -0,0 +1,232 @@
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import traceback
+from typing import Any, cast
+
+from crewai.memory.storage.ltm_sqlite_storage import LTMSQLiteStorage
+from crewai.memory.storage.rag_storage import RAGStorage
+
+
+# Page cache per connection in KiB - lower it on memory-constrained hosts
+SQLITE_CACHE_KIB = int(os.getenv("LTM_SQLITE_CACHE_KIB", "65536"))   # 64 MB
+
+# Applied on every new connection. WAL + synchronous=NORMAL replaces the fsync per commit of
+# the default rollback journal with batched WAL flushes; mmap/cache/temp_store keep reads in memory.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",   # 256 MB
+    f"PRAGMA cache_size=-{SQLITE_CACHE_KIB}",     # negative value = KiB
+)
+
+
+class TunedLTMSQLiteStorage(LTMSQLiteStorage):
+    """
+    LTMSQLiteStorage that keeps one tuned SQLite connection per thread instead of
+    opening a new default connection for every save/load.
+    The SQL is the same as in the CrewAI base class.
+    PRAGMA optimize is run on every open connection at interpreter shutdown.
+    """
+
+    def __init__(self, db_path: str | None = None) -> None:
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        super().__init__(db_path=db_path)
+        atexit.register(self.close)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # check_same_thread=False only so close() can run PRAGMA optimize from the atexit thread;
+            # each connection is still used by the thread that opened it
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            for pragma in SQLITE_PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self) -> None:
+        """Runs PRAGMA optimize (refreshes query planner stats) and closes every connection."""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.execute("PRAGMA optimize")
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+    def _initialize_db(self):
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS long_term_memories (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        task_description TEXT,
+                        metadata TEXT,
+                        datetime TEXT,
+                        score REAL
+                    )
+                """
+                )
+        except sqlite3.Error as e:
+            self._printer.print(
+                content=f"MEMORY ERROR: An error occurred during database initialization: {e}",
+                color="red",
+            )
+
+    def save(
+        self,
+        task_description: str,
+        metadata: dict[str, Any],
+        datetime: str,
+        score: int | float,
+    ) -> None:
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    """
+                INSERT INTO long_term_memories (task_description, metadata, datetime, score)
+                VALUES (?, ?, ?, ?)
+            """,
+                    (task_description, json.dumps(metadata), datetime, score),
+                )
+        except sqlite3.Error as e:
+            self._printer.print(
+                content=f"MEMORY ERROR: An error occurred while saving to LTM: {e}",
+                color="red",
+            )
+
+    def load(self, task_description: str, latest_n: int) -> list[dict[str, Any]] | None:
+        try:
+            rows = self._connection().execute(
+                """
+                SELECT metadata, datetime, score
+                FROM long_term_memories
+                WHERE task_description = ?
+                ORDER BY datetime DESC, score ASC
+                LIMIT ?
+            """,
+                (task_description, latest_n),
+            ).fetchall()
+            if rows:
+                return [
+                    {
+                        "metadata": json.loads(row[0]),
+                        "datetime": row[1],
+                        "score": row[2],
+                    }
+                    for row in rows
+                ]
+        except sqlite3.Error as e:
+            self._printer.print(
+                content=f"MEMORY ERROR: An error occurred while querying LTM: {e}",
+                color="red",
+            )
+        return None
+
+    def reset(self) -> None:
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM long_term_memories")
+        except sqlite3.Error as e:
+            self._printer.print(
+                content=f"MEMORY ERROR: An error occurred while deleting all rows in LTM: {e}",
+                color="red",
+            )
+
+
+class BatchedRAGStorage(RAGStorage):
+    """
+    RAGStorage that coalesces memory writes: save() only queues the entry, and the queue is
+    embedded and stored with a single add_documents() call (one embedder request for the whole
+    batch) on flush(), when flush_threshold entries are pending, or before a search.
+    """
+
+    def __init__(self, *args: Any, flush_threshold: int = 16, **kwargs: Any) -> None:
+        self.flush_threshold = flush_threshold
+        self._pending: list[dict[str, Any]] = []
+        self._pending_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def _collection_name(self) -> str:
+        return f"memory_{self.type}_{self.agents}" if self.agents else f"memory_{self.type}"
+
+    def save(self, value: Any, metadata: dict[str, Any]) -> None:
+        document: dict[str, Any] = {"content": value}
+        if metadata:
+            document["metadata"] = metadata
+        with self._pending_lock:
+            self._pending.append(document)
+            should_flush = len(self._pending) >= self.flush_threshold
+        if should_flush:
+            self.flush()
+
+    def flush(self) -> None:
+        """Embeds and stores all pending memory entries in one batch."""
+        with self._pending_lock:
+            documents, self._pending = self._pending, []
+        if not documents:
+            return
+
+        # CrewAI derives the document ID from content + metadata, and Chroma rejects a whole batch that
+        # repeats an ID - the shared storages easily queue the same entity twice
+        unique_documents: dict[str, dict[str, Any]] = {}
+        for document in documents:
+            key = json.dumps([document["content"], document.get("metadata")], sort_keys=True, default=str)
+            unique_documents.setdefault(key, document)
+        documents = list(unique_documents.values())
+
+        try:
+            self._add_documents(documents)
+        except Exception as e:
+            logging.error(
+                f"Error during {self.type} batched save, saving entries one by one: {e!s}\n{traceback.format_exc()}"
+            )
+            # Same per-entry upserts as the unbatched RAGStorage.save, so one bad entry loses only itself
+            for document in documents:
+                try:
+                    self._add_documents([document])
+                except Exception as e:
+                    logging.error(f"Error during {self.type} save: {e!s}\n{traceback.format_exc()}")
+
+    def _add_documents(self, documents: list[dict[str, Any]]) -> None:
+        client = self._get_client()
+        collection_name = self._collection_name()
+        client.get_or_create_collection(collection_name=collection_name)
+
+        batch_size = None
+        if isinstance(self.embedder_config, dict) and isinstance(self.embedder_config.get("config"), dict):
+            batch_size = self.embedder_config["config"].get("batch_size")
+
+        if batch_size is not None:
+            client.add_documents(
+                collection_name=collection_name,
+                documents=documents,
+                batch_size=cast(int, batch_size),
+            )
+        else:
+            client.add_documents(collection_name=collection_name, documents=documents)
+
+    def search(self, *args: Any, **kwargs: Any) -> list[Any]:
+        # Make pending writes visible before reading
+        self.flush()
+        return super().search(*args, **kwargs)
+
+    def reset(self) -> None:
+        with self._pending_lock:
+            self._pending = []
+        super().reset()
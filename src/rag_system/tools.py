@@ -1,6 +1,6 @@
 import os
 import re
-import requests
+import threading
 from dotenv import load_dotenv
 from urllib.parse import urlparse
 from llama_index.core import VectorStoreIndex
@@ -9,25 +9,67 @@ from llama_index.vector_stores.postgres import PGVectorStore
 from llama_index.embeddings.ollama import OllamaEmbedding
 from llama_index.llms.ollama import Ollama                         #added to fix default OPEN_API_KEY issue
 from crewai.tools import tool
+from .http_client import (
+    get_ollama_client, share_ollama_client, warm_up_embed_model,
+    OLLAMA_NUM_CTX, OLLAMA_LLM_MODEL, OLLAMA_KEEP_ALIVE, OLLAMA_EMBED_MODEL,
+)
 from typing import Dict, Union, Any
 
 
 # Load environment variables to get the database URL
 load_dotenv()
 
+# Opt-in FP16 (HALFVEC) embedding column - an existing VECTOR table has to be migrated first
+# (test/test_PGVector_similarity_search.py --migrate-halfvec)
+PGVECTOR_USE_HALFVEC = os.getenv("PGVECTOR_USE_HALFVEC", "0") == "1"
+
+# Last formatted context returned by the tool on this thread - lets callers (e.g. the eval answer
+# cache) reuse what the crew retrieved instead of running retrieval again
+_last_retrieval = threading.local()
+
+
+def reset_last_retrieval() -> None:
+    _last_retrieval.context = None
+
+
+def get_last_retrieval():
+    """Returns the formatted context of the last successful retrieval on this thread, or None."""
+    return getattr(_last_retrieval, "context", None)
+
+
 def warm_up_ollama(base_url: str, model_name: str) -> bool:
-    """Pre-warm Ollama model to avoid cold start delays"""
-    try:
-        # Send a small embedding request to warm up the model
-        response = requests.post(
-            f"{base_url}/api/embeddings",
-            json={"model": model_name, "prompt": "test"},
-            timeout=30
-        )
-        return response.status_code == 200
-    except Exception as e:
-        print(f"Warning: Could not warm up Ollama model: {e}")
-        return False
+    """Pre-warm Ollama model to avoid cold start delays (once per process, over the shared client)"""
+    return warm_up_embed_model(base_url, model_name)
+
+
+# Initialize the embedding model - use environment variable for base URL to support Docker
+ollama_base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+
+# Same embedding model as ingestion (and the crew memory) - see http_client
+ollama_embed_model = OLLAMA_EMBED_MODEL
+
+# Both models are built once per process instead of on every tool call and share the process-wide
+# Ollama connection pool. OllamaEmbedding has no client argument, hence share_ollama_client.
+embed_model = share_ollama_client(OllamaEmbedding(
+    model_name=ollama_embed_model,
+    base_url=ollama_base_url,
+    request_timeout=120.0  # Increased timeout for slower connections
+))
+
+# Configure the local LLM to prevent fallback to OpenAI
+# Be sure you have a local LLM model running, e.g., 'llama3' or 'gemma3:4b'
+ollama_llm = Ollama(model=OLLAMA_LLM_MODEL,   #added to fix default OPEN_API_KEY issue
+                    base_url=ollama_base_url,
+                    client=get_ollama_client(ollama_base_url),  # Shared connection pool
+                    keep_alive=OLLAMA_KEEP_ALIVE,  # Share the crew agents' resident model
+                    context_window=OLLAMA_NUM_CTX,  # Same num_ctx as the crew LLM, otherwise Ollama reloads the model
+                    request_timeout=120.0  # Increased timeout for slower connections
+                    )
+
+# Set the embedding model in LlamaIndex's global settings
+# Set the global defaults for both the LLM and the embedding model
+Settings.llm = ollama_llm                                                    #added to fix default OPEN_API_KEY issue
+Settings.embed_model = embed_model                                           #added to fix default OPEN_API_KEY issue
 
 
 @tool("Document Retrieval Tool")
@@ -95,6 +137,7 @@ def document_retrieval_tool(query: Union[str, Dict[str, Any]]) -> str:
                 password=db_url_parts.password,
                 table_name=contextual_table,  # Use contextual table if available
                 embed_dim=768, # Dimension for nomic-embed-text
+                use_halfvec=PGVECTOR_USE_HALFVEC, # Must match the embedding column type - see ingestion
                 hybrid_search=True,
                 text_search_config="english",
             )
@@ -103,17 +146,8 @@ def document_retrieval_tool(query: Union[str, Dict[str, Any]]) -> str:
             print(f"DEBUG: Contextual table not available, Run data_ingestion script first to create vector storage: {e}")
             return "No relevant vector storage (i.e. contextual table) found."
  
-        # Initialize the embedding model - use environment variable for base URL to support Docker
-        ollama_base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-        
         # Pre-warm the Ollama model to avoid cold start delays
-        warm_up_ollama(ollama_base_url, "nomic-embed-text:v1.5")
-        
-        embed_model = OllamaEmbedding(
-            model_name="nomic-embed-text:v1.5",
-            base_url=ollama_base_url,
-            request_timeout=120.0  # Increased timeout for slower connections
-        )
+        warm_up_ollama(ollama_base_url, ollama_embed_model)
 
         # Create a LlamaIndex VectorStoreIndex object from the vector store
 
@@ -123,19 +157,6 @@ def document_retrieval_tool(query: Union[str, Dict[str, Any]]) -> str:
         #)
 
 
-        # Configure the local LLM to prevent fallback to OpenAI
-        # Be sure you have a local LLM model running, e.g., 'llama3' or 'gemma3:4b'
-        ollama_llm = Ollama(model="gemma3:4b",                                       #added to fix default OPEN_API_KEY issue
-                            base_url=ollama_base_url,
-                            request_timeout=120.0  # Increased timeout for slower connections
-                            )
-
-        # Set the embedding model in LlamaIndex's global settings
-        # Set the global defaults for both the LLM and the embedding model
-        Settings.llm = ollama_llm                                                    #added to fix default OPEN_API_KEY issue
-        Settings.embed_model = embed_model                                           #added to fix default OPEN_API_KEY issue
-
-
         index = VectorStoreIndex.from_vector_store(
             vector_store=vector_store,
             embed_model=embed_model
@@ -215,6 +236,7 @@ def document_retrieval_tool(query: Union[str, Dict[str, Any]]) -> str:
             formatted_chunks.append(formatted_chunk)
         
         context = "\n\n" + "="*50 + "\n\n".join(formatted_chunks)
+        _last_retrieval.context = context
         
         return context
     except Exception as e:
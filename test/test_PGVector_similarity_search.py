@@ -1,77 +1,443 @@
-import ollama
+import asyncio
+import asyncpg
+import httpx
 import psycopg2
-#from psycopg2.extras import register_vector
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+from contextlib import contextmanager
+from pgvector import HalfVector, Vector
+from pgvector.psycopg2 import register_vector
+from pgvector.asyncpg import register_vector as register_vector_async
 import numpy as np
+import csv
+import hashlib
+import io
+import os
+import re
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
 # --- Configuration ---
 OLLAMA_MODEL = "nomic-embed-text:v1.5"  # Or your chosen Ollama embedding model
+OLLAMA_URL = "http://localhost:11434"
+EMBED_BATCH_SIZE = 32   # Texts per /api/embed request
+EMBED_WORKERS = 2       # Concurrent embed requests per Ollama node
 DB_HOST = "localhost"
 DB_PORT = 5432
 DB_NAME = "rag_db"
 DB_USER = "rag_user"
 DB_PASSWORD = "rag_password"
 TABLE_NAME = "public.data_nbs_doc_md_contextual_rag"
+CONTENT_COLUMN = "text"  # Chunk text column (named "text" in the LlamaIndex PGVectorStore table)
 EMBEDDING_DIM = 768  # Dimension of embeddings from nomic-embed-text
+# Opt-in FP16 storage (half the bytes read per distance). Existing VECTOR tables must be converted first
+# with `python test/test_PGVector_similarity_search.py --migrate-halfvec`; the app reads the same setting.
+USE_HALFVEC = os.getenv("PGVECTOR_USE_HALFVEC", "0") == "1"
+VECTOR_TYPE = "halfvec" if USE_HALFVEC else "vector"
+HNSW_INDEX_NAME_TMPL = "data_nbs_embedding_{}_hnsw_ip_idx"
+HNSW_INDEX_NAME = HNSW_INDEX_NAME_TMPL.format(VECTOR_TYPE)
+COPY_THRESHOLD = 10_000  # Bulk loads larger than this use COPY instead of multi-row INSERTs
+PARALLEL_SCAN_WORKERS = 4  # Parallel workers for exact (non-index) similarity scans
+INGEST_CONCURRENCY = 4  # Async ingest: batches in flight (embedding + COPY) at once
+EMBEDDING_CACHE_TABLE = "public.embedding_cache"  # sha256(model + content) -> normalized embedding
 
 # Construct DATABASE_URL
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
 # --- Database Connection ---
+# Connections are pooled so repeated searches skip the TCP/auth handshake, and every pooled
+# connection prepares the similarity query once so later searches skip parse + plan
+POOL = None
+_initialized_connections = set()
+_prepared_connections = set()
+_ef_search_by_connection = {}  # hnsw.ef_search picked from the table size when find_sim is prepared
+_has_hnsw_by_connection = {}   # Whether an inner-product HNSW index exists - dropped after DDL on the connection
+
+def get_pool():
+    global POOL
+    if POOL is None:
+        POOL = ThreadedConnectionPool(1, 8, dsn=DATABASE_URL)
+    return POOL
+
 def get_db_connection():
-    conn = psycopg2.connect(
-        host=DB_HOST,
-        database=DB_NAME,
-        user=DB_USER,
-        password=DB_PASSWORD
-    )
-    #register_vector(conn)  # Enable pgvector support for psycopg2
+    conn = get_pool().getconn()
+    if conn not in _initialized_connections:
+        register_vector(conn)  # Enable pgvector support for psycopg2 (numpy / HalfVector parameters)
+        _initialized_connections.add(conn)
     return conn
 
+def _prepare_find_sim(conn):
+    # Prepared on first search rather than on checkout, since the table may not exist before setup_database
+    if conn in _prepared_connections:
+        return
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            PREPARE find_sim ({VECTOR_TYPE}, int) AS
+            SELECT id
+            FROM {TABLE_NAME}
+            ORDER BY embedding <#> $1
+            LIMIT $2;
+        """)
+    # Candidate list size at query time - higher means better recall, slower queries
+    _ef_search_by_connection[conn] = configure_hnsw_params(get_vector_count(conn))["ef_search"]
+    _prepared_connections.add(conn)
+
+def _has_hnsw_index_cached(conn):
+    if conn not in _has_hnsw_by_connection:
+        _has_hnsw_by_connection[conn] = has_hnsw_index(conn)
+    return _has_hnsw_by_connection[conn]
+
+def release_db_connection(conn):
+    get_pool().putconn(conn)
+
+@contextmanager
+def db_connection():
+    conn = get_db_connection()
+    try:
+        yield conn
+    finally:
+        release_db_connection(conn)
+
 # --- Embedding Generation ---
+# Keep-alive connection pool shared by all embedding requests (no TCP setup per request)
+SESSION = httpx.Client(
+    base_url=OLLAMA_URL,
+    timeout=httpx.Timeout(300.0, connect=10.0),
+    limits=httpx.Limits(max_keepalive_connections=40, max_connections=100, keepalive_expiry=30.0),
+)
+
+def embed_batch(texts):
+    # One request to the batch /api/embed endpoint instead of one /api/embeddings round-trip per text
+    try:
+        response = SESSION.post("/api/embed", json={"model": OLLAMA_MODEL, "input": texts})
+        response.raise_for_status()
+        embeddings = response.json().get('embeddings')
+        if embeddings and len(embeddings) == len(texts):
+            return embeddings
+    except httpx.HTTPStatusError as e:
+        # Servers without batch support (Ollama < 0.3) answer 404 on /api/embed; anything else is a real error
+        if e.response.status_code != 404:
+            raise
+    # Fallback for servers without batch support: legacy single-text endpoint
+    embeddings = []
+    for text in texts:
+        response = SESSION.post("/api/embeddings", json={"model": OLLAMA_MODEL, "prompt": text})
+        response.raise_for_status()
+        embeddings.append(response.json()['embedding'])
+    return embeddings
+
+def generate_embeddings(texts):
+    if len(texts) <= EMBED_BATCH_SIZE:
+        return embed_batch(texts)
+    # Several batches in flight at once so the Ollama node is not idle between requests
+    batches = [texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as ex:
+        return [embedding for batch in ex.map(embed_batch, batches) for embedding in batch]
+
 def generate_embedding(text):
-    response = ollama.embeddings(model=OLLAMA_MODEL, prompt=text)
-    return response['embedding']
+    return generate_embeddings([text])[0]
+
+def normalize_embedding(embedding):
+    # Stored and query vectors are unit-norm so inner product (<#>) ranks exactly like L2/cosine
+    # while skipping the subtraction in pgvector's distance kernel.
+    # A fresh array per call (safe for concurrent callers), normalized in place in the big-endian float32
+    # Vector stores internally ('>f4'), so the adapter keeps it without another copy; halfvec columns get
+    # the one extra '>f2' copy HalfVector stores
+    v = np.array(embedding, dtype=">f4")
+    v /= np.linalg.norm(v)
+    return v.astype(">f2") if USE_HALFVEC else v
+
+def _to_db_vector(embedding):
+    return HalfVector(embedding) if USE_HALFVEC else Vector(embedding)
+
+def _from_db_vector(value):
+    # register_vector decodes halfvec to HalfVector and vector to a numpy array
+    return value.to_numpy() if isinstance(value, HalfVector) else np.asarray(value)
 
 # --- Database Operations ---
+def configure_hnsw_params(vector_count):
+    """Pick HNSW (m, ef_construction, ef_search) for the number of vectors in the table."""
+    if vector_count < 100_000:
+        return {"m": 16, "ef_construction": 64, "ef_search": 40}
+    elif vector_count < 1_000_000:
+        return {"m": 24, "ef_construction": 128, "ef_search": 100}
+    else:
+        return {"m": 32, "ef_construction": 200, "ef_search": 200}
+
+def get_vector_count(conn):
+    # Planner estimate - cheap compared to COUNT(*) on a large table (-1 if never analyzed)
+    with conn.cursor() as cur:
+        cur.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s);", (TABLE_NAME,))
+        row = cur.fetchone()
+    return max(row[0], 0) if row else 0
+
+def has_hnsw_index(conn):
+    # Only an HNSW index with the inner-product opclass can serve the `<#>` ORDER BY - a
+    # vector_cosine_ops / halfvec_cosine_ops index on the same column leaves the query a sequential scan
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT EXISTS (
+                SELECT 1
+                FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indexrelid
+                JOIN pg_am am ON am.oid = c.relam
+                JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+                JOIN pg_opclass opc ON opc.oid = i.indclass[0]
+                WHERE i.indrelid = to_regclass(%s) AND a.attname = 'embedding' AND am.amname = 'hnsw'
+                  AND opc.opcname = %s
+            );
+        """, (TABLE_NAME, f"{VECTOR_TYPE}_ip_ops"))
+        return cur.fetchone()[0]
+
+def _configure_index_build(cur):
+    # Keep the whole HNSW graph in memory during the build (past ~100k rows pgvector otherwise warns
+    # "hnsw graph no longer fits into maintenance_work_mem" and falls back to a much slower build)
+    # and build with half the worker processes. SET takes no expressions, hence set_config().
+    # Transaction-scoped (SET LOCAL / is_local=true): the CREATE INDEX commits in the same transaction,
+    # so the pooled connection goes back with the server defaults.
+    cur.execute("SET LOCAL maintenance_work_mem = '2GB';")
+    cur.execute("""
+        SELECT set_config(
+            'max_parallel_maintenance_workers',
+            GREATEST(1, current_setting('max_worker_processes')::int / 2)::text,
+            true
+        );
+    """)
+
 def setup_database(conn):
     with conn.cursor() as cur:
         cur.execute(f"""
             CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
                 id SERIAL PRIMARY KEY,
-                content TEXT,
-                embedding VECTOR({EMBEDDING_DIM})
+                {CONTENT_COLUMN} TEXT,
+                embedding {VECTOR_TYPE.upper()}({EMBEDDING_DIM})
             );
         """)
         conn.commit()
 
-def insert_document(conn, content):
-    embedding = generate_embedding(content)
+    setup_embedding_cache(conn)
+
+    # HNSW index so similarity search is an approximate graph search instead of a sequential scan
+    hnsw_params = configure_hnsw_params(get_vector_count(conn))
     with conn.cursor() as cur:
+        _configure_index_build(cur)
         cur.execute(f"""
-            INSERT INTO {TABLE_NAME} (content, embedding)
-            VALUES (%s, %s);
-        """, (content, np.array(embedding)))
+            CREATE INDEX IF NOT EXISTS {HNSW_INDEX_NAME} ON {TABLE_NAME}
+            USING hnsw (embedding {VECTOR_TYPE}_ip_ops)
+            WITH (m = {hnsw_params['m']}, ef_construction = {hnsw_params['ef_construction']});
+        """)
         conn.commit()
+    _has_hnsw_by_connection.pop(conn, None)  # Re-checked on the next search
 
-def find_similar_documents(conn, query_text, limit=5):
-    query_embedding = generate_embedding(query_text)
+def _has_vector_embedding_column(cur, table_name):
+    cur.execute("""
+        SELECT format_type(atttypid, atttypmod)
+        FROM pg_attribute
+        WHERE attrelid = to_regclass(%s) AND attname = 'embedding';
+    """, (table_name,))
+    row = cur.fetchone()
+    return bool(row) and row[0].startswith("vector")
+
+def migrate_embedding_to_halfvec(conn):
+    """
+    Converts the existing VECTOR embedding columns (documents and embedding cache) to HALFVEC (FP16, half
+    the bytes read per distance), so cached and freshly computed embeddings have the same precision.
+    Indexes on the document column are dropped and rebuilt with the matching halfvec operator class; this
+    script's HNSW index is rebuilt under its halfvec name so setup_database does not build a second, identical one.
+    Explicit one-off step (--migrate-halfvec) before running with PGVECTOR_USE_HALFVEC=1.
+    """
     with conn.cursor() as cur:
+        if _has_vector_embedding_column(cur, TABLE_NAME):
+            cur.execute("""
+                SELECT i.indexrelid::regclass::text, pg_get_indexdef(i.indexrelid)
+                FROM pg_index i
+                JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+                WHERE i.indrelid = to_regclass(%s) AND a.attname = 'embedding';
+            """, (TABLE_NAME,))
+            embedding_indexes = cur.fetchall()
+
+            for index_name, _ in embedding_indexes:
+                cur.execute(f"DROP INDEX {index_name};")
+            cur.execute(f"""
+                ALTER TABLE {TABLE_NAME}
+                ALTER COLUMN embedding TYPE HALFVEC({EMBEDDING_DIM}) USING embedding::halfvec({EMBEDDING_DIM});
+            """)
+            _configure_index_build(cur)
+            for _, index_def in embedding_indexes:
+                index_def = index_def.replace(
+                    f" {HNSW_INDEX_NAME_TMPL.format('vector')} ON ", f" {HNSW_INDEX_NAME_TMPL.format('halfvec')} ON ", 1
+                )
+                cur.execute(re.sub(r"\bvector_(\w+_ops)\b", r"halfvec_\1", index_def))
 
+        if _has_vector_embedding_column(cur, EMBEDDING_CACHE_TABLE):
+            cur.execute(f"""
+                ALTER TABLE {EMBEDDING_CACHE_TABLE}
+                ALTER COLUMN embedding TYPE HALFVEC({EMBEDDING_DIM}) USING embedding::halfvec({EMBEDDING_DIM});
+            """)
+        conn.commit()
+    _has_hnsw_by_connection.pop(conn, None)  # Re-checked on the next search
+
+def setup_embedding_cache(conn):
+    with conn.cursor() as cur:
         cur.execute(f"""
-            SELECT id, text
-            FROM {TABLE_NAME}
-            ORDER BY embedding <-> %s
-            LIMIT %s;
-        """, (str(query_embedding), limit))
+            CREATE TABLE IF NOT EXISTS {EMBEDDING_CACHE_TABLE} (
+                content_sha256 BYTEA PRIMARY KEY,
+                embedding {VECTOR_TYPE.upper()}({EMBEDDING_DIM})
+            );
+        """)
+        conn.commit()
+
+def _content_hash(text):
+    # The model name is part of the key so switching OLLAMA_MODEL never serves the old model's vectors
+    return hashlib.sha256(f"{OLLAMA_MODEL}\0{text}".encode("utf-8")).digest()
+
+def get_or_compute_embeddings(conn, texts):
+    """
+    Returns the normalized embedding of every text, calling Ollama only for texts whose content hash
+    is not in the embedding cache yet. Duplicates within the batch are embedded once.
+    """
+    hashes = [_content_hash(text) for text in texts]
+    unique = dict(zip(hashes, texts))  # Client-side dedupe before hitting the cache or Ollama
+
+    with conn.cursor() as cur:
+        cur.execute(
+            f"SELECT content_sha256, embedding FROM {EMBEDDING_CACHE_TABLE} WHERE content_sha256 = ANY(%s);",
+            ([psycopg2.Binary(h) for h in unique],),
+        )
+        cached = {bytes(h): _from_db_vector(embedding) for h, embedding in cur.fetchall()}
+
+    missing = [h for h in unique if h not in cached]
+    if missing:
+        computed = [normalize_embedding(e) for e in generate_embeddings([unique[h] for h in missing])]
+        with conn.cursor() as cur:
+            execute_values(
+                cur,
+                f"INSERT INTO {EMBEDDING_CACHE_TABLE} (content_sha256, embedding) VALUES %s ON CONFLICT DO NOTHING",
+                [(psycopg2.Binary(h), _to_db_vector(e)) for h, e in zip(missing, computed)],
+                template=f"(%s, %s::{VECTOR_TYPE})",
+                page_size=500,
+            )
+        conn.commit()
+        cached.update(zip(missing, computed))
+
+    return [cached[h] for h in hashes]
+
+def get_or_compute_embedding(conn, text):
+    return get_or_compute_embeddings(conn, [text])[0]
+
+def insert_documents_bulk(conn, rows):
+    """
+    Writes (content, embedding) rows in one transaction: multi-row INSERTs of 500 rows per
+    statement, or COPY for large loads. One commit (and one WAL flush) for the whole batch.
+    """
+    with conn.cursor() as cur:
+        if len(rows) > COPY_THRESHOLD:
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            for content, embedding in rows:
+                writer.writerow((content, "[" + ",".join(map(str, embedding)) + "]"))
+            buf.seek(0)
+            cur.copy_expert(f"COPY {TABLE_NAME} ({CONTENT_COLUMN}, embedding) FROM STDIN WITH (FORMAT csv)", buf)
+        else:
+            execute_values(
+                cur,
+                f"INSERT INTO {TABLE_NAME} ({CONTENT_COLUMN}, embedding) VALUES %s",
+                [(content, _to_db_vector(embedding)) for content, embedding in rows],
+                template=f"(%s, %s::{VECTOR_TYPE})",
+                page_size=500,
+            )
+    conn.commit()
+
+def insert_documents(conn, contents):
+    # Embed the whole batch in one call (skipping chunks already in the embedding cache), then bulk-write it
+    embeddings = get_or_compute_embeddings(conn, contents)
+    insert_documents_bulk(conn, list(zip(contents, embeddings)))
+
+def find_similar_documents(conn, query_text, limit=5):
+    query_embedding = normalize_embedding(generate_embedding(query_text))
+    _prepare_find_sim(conn)
+    # ef_search below LIMIT would return fewer than `limit` rows
+    settings = [f"SET LOCAL hnsw.ef_search = {max(_ef_search_by_connection[conn], limit)}"]
+    # Without the HNSW index this is an exact sequential scan - let Postgres split the
+    # distance computation across parallel workers (check "Workers Launched" in
+    # EXPLAIN (ANALYZE, VERBOSE, BUFFERS) EXECUTE find_sim(...)). Only then: these settings make a
+    # parallel seq scan look cheap enough that the planner could pick it over the HNSW index scan.
+    # The index check is cached per connection (re-checked after DDL here; an index another process
+    # builds is seen by new connections). A generic plan cached for find_sim would ignore the settings,
+    # so the statement is replanned on every EXECUTE on this path.
+    if not _has_hnsw_index_cached(conn):
+        settings += [
+            f"SET LOCAL max_parallel_workers_per_gather = {PARALLEL_SCAN_WORKERS}",
+            "SET LOCAL parallel_setup_cost = 0",
+            "SET LOCAL min_parallel_table_scan_size = 0",
+            "SET LOCAL plan_cache_mode = force_custom_plan",
+        ]
+    with conn.cursor() as cur:
+        # All settings in one round-trip before the EXECUTE
+        cur.execute("; ".join(settings) + ";")
+
+        cur.execute(f"EXECUTE find_sim(%s::{VECTOR_TYPE}, %s);", (_to_db_vector(query_embedding), limit))
+
+        ids = [row[0] for row in cur.fetchall()]
+    return fetch_contents(conn, ids)
+
+def fetch_contents(conn, ids):
+    # Second, narrow lookup by primary key - the ANN scan above only reads ids and embeddings,
+    # so the chunk text is detoasted just for the rows actually returned
+    if not ids:
+        return []
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT id, {CONTENT_COLUMN} FROM {TABLE_NAME} WHERE id = ANY(%s);", (list(ids),))
+        contents = dict(cur.fetchall())
+    return [(doc_id, contents[doc_id]) for doc_id in ids if doc_id in contents]
+
+# --- Async Ingest ---
+# Overlaps Ollama embedding with Postgres writes: while one batch is being embedded, earlier
+# batches are streamed into the table with asyncpg's binary COPY protocol.
+async def embed_batch_async(client, texts):
+    response = await client.post("/api/embed", json={"model": OLLAMA_MODEL, "input": texts})
+    response.raise_for_status()
+    return response.json()['embeddings']
+
+async def _init_async_connection(conn):
+    await register_vector_async(conn)  # Binary codecs for vector/halfvec parameters
+
+async def ingest_async(texts):
+    schema_name, table_name = TABLE_NAME.split(".", 1)
+    batches = [texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+    sem = asyncio.Semaphore(INGEST_CONCURRENCY)
+
+    async with httpx.AsyncClient(
+        base_url=OLLAMA_URL,
+        timeout=httpx.Timeout(300.0, connect=10.0),
+        limits=httpx.Limits(max_keepalive_connections=INGEST_CONCURRENCY, max_connections=INGEST_CONCURRENCY),
+    ) as client, asyncpg.create_pool(
+        DATABASE_URL, min_size=1, max_size=INGEST_CONCURRENCY, init=_init_async_connection
+    ) as pool:
+
+        async def ingest_batch(batch):
+            async with sem:
+                embeddings = [_to_db_vector(normalize_embedding(e)) for e in await embed_batch_async(client, batch)]
+                async with pool.acquire() as conn:
+                    await conn.copy_records_to_table(
+                        table_name,
+                        schema_name=schema_name,
+                        records=list(zip(batch, embeddings)),
+                        columns=[CONTENT_COLUMN, "embedding"],
+                    )
 
-        results = cur.fetchall()
-    return [(row[0],row[1]) for row in results]
+        await asyncio.gather(*[ingest_batch(batch) for batch in batches])
 
 # --- Main Execution ---
 if __name__ == "__main__":
     conn = None
     try:
+        # One-off conversion of an existing VECTOR table before switching to PGVECTOR_USE_HALFVEC=1
+        if sys.argv[1:] == ["--migrate-halfvec"]:
+            conn = get_db_connection()
+            migrate_embedding_to_halfvec(conn)
+            print("Embedding columns migrated to HALFVEC - set PGVECTOR_USE_HALFVEC=1 for the app and this script.")
+            sys.exit(0)
 
 		# Check if a query was passed as a command-line argument
         if len(sys.argv) > 1:
@@ -86,10 +452,12 @@ if __name__ == "__main__":
 
         # Insert some example documents
         #print("Inserting documents...")
-        #insert_document(conn, "The quick brown fox jumps over the lazy dog.")
-        #insert_document(conn, "Artificial intelligence is transforming industries.")
-        #insert_document(conn, "Machine learning algorithms are at the core of AI.")
-        #insert_document(conn, "Dogs are known for their loyalty and companionship.")
+        #insert_documents(conn, [
+        #    "The quick brown fox jumps over the lazy dog.",
+        #    "Artificial intelligence is transforming industries.",
+        #    "Machine learning algorithms are at the core of AI.",
+        #    "Dogs are known for their loyalty and companionship.",
+        #])
         #print("Documents inserted.")
 
         # Perform similarity search
@@ -112,4 +480,6 @@ if __name__ == "__main__":
         print(f"An error occurred: {e}")
     finally:
         if conn:
-            conn.close()
+            release_db_connection(conn)
+        if POOL is not None:
+            POOL.closeall()
@@ -0,0 +1,63 @@
+import threading
+
+import pytest
+
+pytest.importorskip("crewai")
+
+from src.rag_system.memory_storage import BatchedRAGStorage
+
+
+class FakeRAGClient:
+    """Stands in for CrewAI's Chroma client - rejects a batch that repeats a document, like Chroma's upsert."""
+
+    def __init__(self, fail_batches=False):
+        self.fail_batches = fail_batches
+        self.documents = []
+
+    def get_or_create_collection(self, collection_name):
+        pass
+
+    def add_documents(self, collection_name, documents, batch_size=None):
+        keys = [(d["content"], repr(d.get("metadata"))) for d in documents]
+        if len(set(keys)) != len(keys):
+            raise ValueError("Expected IDs to be unique")
+        if self.fail_batches and len(documents) > 1:
+            raise RuntimeError("batch rejected")
+        self.documents.extend(documents)
+
+
+def make_storage(client):
+    # Skips RAGStorage.__init__, which builds the embedder and the Chroma client
+    storage = BatchedRAGStorage.__new__(BatchedRAGStorage)
+    storage.flush_threshold = 16
+    storage._pending = []
+    storage._pending_lock = threading.Lock()
+    storage.type = "entities"
+    storage.agents = ""
+    storage.embedder_config = None
+    storage._get_client = lambda: client
+    return storage
+
+
+def test_flush_dedupes_identical_entries():
+    client = FakeRAGClient()
+    storage = make_storage(client)
+
+    storage.save("Acme Corp (Company): supplier", {"relationships": "supplies NBS"})
+    storage.save("Acme Corp (Company): supplier", {"relationships": "supplies NBS"})
+    storage.save("Acme Corp (Company): supplier", {"relationships": "audited by NBS"})
+    storage.flush()
+
+    assert [d["metadata"]["relationships"] for d in client.documents] == ["supplies NBS", "audited by NBS"]
+    assert storage._pending == []
+
+
+def test_flush_saves_entries_one_by_one_when_the_batch_fails():
+    client = FakeRAGClient(fail_batches=True)
+    storage = make_storage(client)
+
+    storage.save("first", {"agent": "researcher"})
+    storage.save("second", {"agent": "researcher"})
+    storage.flush()
+
+    assert [d["content"] for d in client.documents] == ["first", "second"]